@@ -20,9 +20,12 @@
 # You should have received a copy of the GNU General Public License
 # along with DroneBL.py. If not, see <http://www.gnu.org/licenses/>.
 
-import argparse, datetime, io, ipaddress, json, os.path, re, sys
-import xml.etree.ElementTree as et
-import http.client
+import argparse, atexit, functools, json, os.path, sys, time
+
+try:
+	from lxml import etree as et
+except ImportError:
+	import xml.etree.ElementTree as et
 
 homedir = os.path.expanduser('~')
 defconffile = os.path.join(homedir, '.dronebl')
@@ -31,65 +34,176 @@ config = {'rpckey': None, 'staging': False, 'debug': False}
 
 parser = None
 
+# Each thread sending requests keeps its own connection to reuse
+rpclocal = None
+rpcconns = []
+
+# Requests with more methods than this are split up into several requests
+maxmethods = 100
+maxworkers = 4
+rpcexecutor = None
+
+rpcheaders = {'Connection': 'keep-alive', 'Accept-Encoding': 'gzip'}
+
+# Options passed through as attributes of each method when they are set
+queryopts = ('own', 'limit', 'listed', 'type', 'start', 'stop')
+addopts = ('type', 'port', 'comment')
+updateopts = ('comment',)
+
+# Methods accepted by the batch command and the attributes each may be given
+batchmethods = {
+	'lookup': ('id', 'ip') + queryopts,
+	'add': ('ip',) + addopts,
+	'remove': ('id',),
+	'update': ('id',) + updateopts
+	}
+
 def checkint(val):
 	try:
 		return int(val)
 	except:
 		return None
 
+@functools.lru_cache(maxsize=1024)
 def ipaddr(val):
-	try:
-		ipn = ipaddress.ip_network(val, False)
-		ipa = ipn.network_address
-		if ipn.prefixlen == ipa.max_prefixlen:
-			return ipa
-		else:
-			return ipn
-	except:
-		return None
+	import socket
+
+	host, sep, prefix = val.partition('/')
+
+	for family, bits in ((socket.AF_INET, 32), (socket.AF_INET6, 128)):
+		try:
+			packed = socket.inet_pton(family, host)
+		except (OSError, ValueError):
+			continue
+
+		if len(sep) == 0:
+			return socket.inet_ntop(family, packed)
+
+		if not prefix.isascii() or not prefix.isdigit():
+			raise ValueError('invalid CIDR prefix length')
+		prefixlen = int(prefix)
+		if prefixlen > bits:
+			raise ValueError('CIDR prefix length must not exceed %d' % (bits))
+
+		# Clear the host bits to get the network address of the range
+		mask = ((1 << bits) - 1) ^ ((1 << (bits - prefixlen)) - 1)
+		packed = (int.from_bytes(packed, 'big') & mask).to_bytes(bits // 8, 'big')
+		addr = socket.inet_ntop(family, packed)
+
+		if prefixlen == bits:
+			return addr
+		return addr + '/' + str(prefixlen)
+
+	raise ValueError('value must be an IP address or a CIDR address')
 
 def idorip(val):
 	i = checkint(val)
 	if i is None:
-		i = ipaddr(val)
-		if i is None:
+		try:
+			return ipaddr(val)
+		except ValueError:
 			raise ValueError('value must be either an integer, an IP address or a CIDR address')
-		return i
-	return i
+	if i < 1:
+		raise ValueError('value must be greater than 0')
+	return str(i)
+
+def intrange(val, low, high):
+	i = int(val)
+	if not low <= i <= high:
+		raise ValueError('value must be between %d and %d' % (low, high))
+	return str(i)
 
 def portnumber(val):
-	port = int(val)
-	if port < 1:
-		raise ValueError('value must be greater than 0')
-	if port > 65535:
-		raise ValueError('value must be less than 65536')
-	return port
+	return intrange(val, 1, 65535)
 
 def listingtype(val):
-	type = int(val)
-	if type < 1:
-		raise ValueError('value must be greater than 0')
-	if type > 255:
-		raise ValueError('value must be less than 256')
-	return type
+	return intrange(val, 1, 255)
 
 def querylimit(val):
-	lim = int(val)
-	if lim < 1:
-		raise ValueError('value must be greater than 0')
-	if lim > 255:
-		raise ValueError('value must be less than 1001')
-	return lim
+	return intrange(val, 1, 1000)
 
 def positiveint(val):
 	i = int(val)
 	if i < 1:
 		raise ValueError('value must be greater than 0')
-	return i
+	return str(i)
+
+def timestamp(val):
+	ts = int(val)
+	if ts < 0:
+		raise ValueError('value must not be negative')
+	return str(ts)
+
+def listedstate(val):
+	if not val in ('0', '1', '2'):
+		raise ValueError('value must be 0, 1 or 2')
+	return val
+
+# Validators applied to attribute values read by the batch command
+batchvalidators = {
+	'ip': ipaddr,
+	'id': positiveint,
+	'type': listingtype,
+	'port': portnumber,
+	'limit': querylimit,
+	'start': timestamp,
+	'stop': timestamp,
+	'listed': listedstate
+	}
 
-def parse_args(conffile=defconffile):
+def add_query_args(sparser):
+	sparser.add_argument('idorip', help='ID or IP address to lookup', action='store', nargs='+', type=idorip)
+	sparser.add_argument('-o', '--own', help='Only show records owned by the RPC key used', dest='own', action='store_const', const='1', default=None)
+	sparser.add_argument('-l', '--listed', help='Show only records with listed being either 0 (not active), 1 (Active)', dest='listed', action='store', default=None, choices=['0', '1', '2'], metavar='{0,1}')
+	sparser.add_argument('-t', '--type', help='Show only results with the specified type', dest='type', action='store', default=None, type=listingtype, metavar='{1-255}')
+	sparser.add_argument('-s', '--start', help='A unix timestamp specifying the start offset of results to show', dest='start', action='store', default=None, type=timestamp)
+	sparser.add_argument('-e', '--stop', help='A unix timestamp specifying the ending offset of results to show', dest='stop', action='store', default=None, type=timestamp)
+	sparser.add_argument('-n', '--limit', help='Limit the number or records to the specified number', dest='limit', action='store', default=None, type=querylimit, metavar='{1-1000}')
+
+def add_add_args(sparser):
+	sparser.add_argument('ip', help='IP address to be added', action='store', nargs='+', type=ipaddr)
+	sparser.add_argument('-t', '--type', help='Specify the type for IPs being added', dest='type', action='store', default=None, type=listingtype, metavar='{1-255}', required=True)
+	sparser.add_argument('-p', '--port', help='The port associated with the new listing, if applicable', dest='port', action='store', default=None, type=portnumber, metavar='{1-65535}')
+	sparser.add_argument('-c', '--comment', help='A comment to ba associayed with the new listing', dest='comment', action='store', default=None)
+	sparser.epilog = 'Note: type, port and comment options apply to all IP addresses supplied'
+
+def add_remove_args(sparser):
+	sparser.add_argument('id', help='Listing ID to remove', action='store', nargs='+', type=positiveint)
+
+def add_update_args(sparser):
+	sparser.add_argument('id', help='Listing ID to update', action='store', nargs='+', type=positiveint)
+	sparser.add_argument('-c', '--comment', help='A comment to ba applied to the specified listing(s)', dest='comment', action='store', required=True)
+
+def add_batch_args(sparser):
+	sparser.add_argument('file', help='File to read actions from, one per line (default: stdin)', action='store', nargs='?', type=argparse.FileType('r'), default='-')
+	sparser.epilog = 'Each line takes the form "<method> <name>=<value> ...", e.g. "add ip=192.0.2.1 type=3 comment=\'open proxy\'", where method is one of: ' + ', '.join(batchmethods)
+
+def add_config_args(sparser):
+	sparser.add_argument('-r', '--rpckey', help='Specify an RPC key to save to config', action='store', dest='rpckey', default=None)
+	sparser.add_argument('-s', '--staging', help='Enable or disable staging', action='store', dest='staging', choices=['yes', 'no'], default=None)
+	sparser.add_argument('-d', '--debug', help=argparse.SUPPRESS, action='store', dest='debug', choices=['yes', 'no'], default=None)
+
+def parse_args(conffile=defconffile, argv=None):
 	global args, parser
 
+	if argv is None:
+		argv = sys.argv[1:]
+
+	subcmds = [
+		('help', 'Show this help message and exit', None),
+		('types', 'Show a list of available listing types', None),
+		('query', 'Query DroneBL for entries', add_query_args),
+		('add', 'Add an entry to DroneBL', add_add_args),
+		('remove', 'Remove an entry from DroneBL', add_remove_args),
+		('update', 'Update an entry on DroneBL', add_update_args),
+		('batch', 'Send multiple actions read from a file', add_batch_args),
+		('config', 'Display or modify local configuration', add_config_args)
+		]
+
+	# Only the chosen command needs its arguments set up, unless it can't be
+	# picked out of the command line unambiguously
+	chosen = [name for name, cmdhelp, addargs in subcmds if name in argv]
+
 	parser = argparse.ArgumentParser(add_help=False)
 	parser.add_argument('-h', '-?', '--help', help='Show this help message and exit', action='help')
 	parser.add_argument('-c', '--config', help='Specify a configuration file to use', action='store', dest='conffile', default=conffile)
@@ -98,39 +212,12 @@ def parse_args(conffile=defconffile):
 	subparsers = parser.add_subparsers(title='command', help='Available commands', dest='command')
 	subparsers.required = True
 
-	sparser_help = subparsers.add_parser('help', help='Show this help message and exit')
-
-	sparser_typelist = subparsers.add_parser('types', help='Show a list of available listing types')
-
-	sparser_query = subparsers.add_parser('query', help='Query DroneBL for entries')
-	sparser_query.add_argument('idorip', help='ID or IP address to lookup', action='store', nargs='+', type=idorip)
-	sparser_query.add_argument('-o', '--own', help='Only show records owned by the RPC key used', dest='own', action='store_true', default=False)
-	sparser_query.add_argument('-l', '--listed', help='Show only records with listed being either 0 (not active), 1 (Active)', dest='listed', action='store', default=None, type=int, choices=range(0, 3), metavar='{0,1}')
-	sparser_query.add_argument('-t', '--type', help='Show only results with the specified type', dest='type', action='store', default=None, type=listingtype, metavar='{1-255}')
-	sparser_query.add_argument('-s', '--start', help='A unix timestamp specifying the start offset of results to show', dest='start', action='store', default=None, type=int)
-	sparser_query.add_argument('-e', '--stop', help='A unix timestamp specifying the ending offset of results to show', dest='stop', action='store', default=None, type=int)
-	sparser_query.add_argument('-n', '--limit', help='Limit the number or records to the specified number', dest='limit', action='store', default=None, type=querylimit, metavar='{1-1000}')
-
-	sparser_add = subparsers.add_parser('add', help='Add an entry to DroneBL')
-	sparser_add.add_argument('ip', help='IP address to be added', action='store', nargs='+', type=ipaddr)
-	sparser_add.add_argument('-t', '--type', help='Specify the type for IPs being added', dest='type', action='store', default=None, type=listingtype, metavar='{1-255}', required=True)
-	sparser_add.add_argument('-p', '--port', help='The port associated with the new listing, if applicable', dest='port', action='store', default=None, type=portnumber, metavar='{1-65535}')
-	sparser_add.add_argument('-c', '--comment', help='A comment to ba associayed with the new listing', dest='comment', action='store', default=None)
-	sparser_add.epilog = 'Note: type, port and comment options apply to all IP addresses supplied'
-
-	sparser_remove = subparsers.add_parser('remove', help='Remove an entry from DroneBL')
-	sparser_remove.add_argument('id', help='Listing ID to remove', action='store', nargs='+', type=positiveint)
+	for name, cmdhelp, addargs in subcmds:
+		sparser = subparsers.add_parser(name, help=cmdhelp)
+		if addargs is not None and (len(chosen) != 1 or chosen[0] == name):
+			addargs(sparser)
 
-	sparser_modify = subparsers.add_parser('update', help='Update an entry on DroneBL')
-	sparser_modify.add_argument('id', help='Listing ID to update', action='store', nargs='+', type=positiveint)
-	sparser_modify.add_argument('-c', '--comment', help='A comment to ba applied to the specified listing(s)', dest='comment', action='store', required=True)
-
-	sparser_config = subparsers.add_parser('config', help='Display or modify local configuration')
-	sparser_config.add_argument('-r', '--rpckey', help='Specify an RPC key to save to config', action='store', dest='rpckey', default=None)
-	sparser_config.add_argument('-s', '--staging', help='Enable or disable staging', action='store', dest='staging', choices=['yes', 'no'], default=None)
-	sparser_config.add_argument('-d', '--debug', help=argparse.SUPPRESS, action='store', dest='debug', choices=['yes', 'no'], default=None)
-
-	args = parser.parse_args()
+	args = parser.parse_args(argv)
 
 def load_config():
 	global args, config
@@ -156,6 +243,36 @@ def load_config():
 	if 'debug' in newconfig:
 		config['debug'] = newconfig['debug']
 
+def save_config():
+	global args, config
+
+	import tempfile
+
+	# Write to a temporary file and rename it over the old one so an
+	# interrupted write can never leave a truncated configuration behind.
+	# Symlinks are resolved first so a linked config file is written through.
+	conffile = os.path.realpath(args.conffile)
+
+	fd, tmpfile = tempfile.mkstemp(prefix='.dronebl.', dir=os.path.dirname(conffile))
+	try:
+		# Keep the existing file's permissions, new files stay private to the user
+		try:
+			os.chmod(tmpfile, os.stat(conffile).st_mode & 0o7777)
+		except FileNotFoundError:
+			pass
+
+		with os.fdopen(fd, 'w') as fc:
+			json.dump(config, fc)
+			fc.flush()
+			os.fsync(fc.fileno())
+		os.replace(tmpfile, conffile)
+	except:
+		try:
+			os.unlink(tmpfile)
+		except OSError:
+			pass
+		raise
+
 def get_rpcrequest():
 	global config
 
@@ -168,67 +285,186 @@ def get_rpcrequest():
 
 	return root
 
+def get_methodargs(names):
+	global args
+
+	return {name: value for name in names if (value := getattr(args, name)) is not None}
+
 def req_addmethod(req, method, *args, **kwargs):
 	try:
 		el = et.SubElement(req, method, **kwargs)
 	except Exception as ex:
 		print('Error adding request method: ' + str(ex))
+		sys.exit(-1)
 
 def get_rawxml(root):
 	try:
-		vf = io.BytesIO()
-		tree = et.ElementTree(root)
-		tree.write(vf, encoding='UTF-8', xml_declaration=True)
-		xmlraw = vf.getvalue()
-		vf.close()
-		return xmlraw
+		return et.tostring(root, encoding='UTF-8', xml_declaration=True)
 	except Exception as ex:
 		print('Error generating request body XML: ' + str(ex))
 		sys.exit(-1)
 
-def send_rpcrequest(req, printxmlres=False):
-	try:
-		xmlreq = get_rawxml(req)
+def get_rpcconnection():
+	# http.client pulls in the email package, so only import it when a request is actually made
+	import http.client
+
+	conn = getattr(rpclocal, 'conn', None)
+	if conn is None:
 		conn = http.client.HTTPSConnection("dronebl.org")
-		conn.request("POST", "/rpc2", xmlreq)
-		response = conn.getresponse()
-		xmlres = response.read().decode('utf-8')
+		rpclocal.conn = conn
+		rpcconns.append(conn)
+
+	return conn
+
+def close_rpcconnection():
+	conn = getattr(rpclocal, 'conn', None)
+	if conn is not None:
 		conn.close()
+		rpcconns.remove(conn)
+		rpclocal.conn = None
 
-		xmlobj = et.fromstring(xmlres)
-	except Exception as ex:
-		print('Error retrieving RPC response: ' + str(ex))
-		sys.exit(-1)
+def close_rpcconnections():
+	while len(rpcconns) > 0:
+		rpcconns.pop().close()
+
+atexit.register(close_rpcconnections)
 
+def post_rpcrequest(xmlreq):
+	import http.client
+
+	conn = get_rpcconnection()
+	reused = conn.sock is not None
+	try:
+		conn.request("POST", "/rpc2", xmlreq, headers=rpcheaders)
+		return conn.getresponse()
+	except (http.client.RemoteDisconnected, ConnectionError):
+		close_rpcconnection()
+		# The server may have dropped an idle keep-alive connection, retry once on a new one
+		if not reused:
+			raise
+
+	conn = get_rpcconnection()
+	conn.request("POST", "/rpc2", xmlreq, headers=rpcheaders)
+	return conn.getresponse()
+
+class RPCError(Exception):
+	pass
+
+def check_rpcresponse(xmlobj):
 	if xmlobj.tag != 'response':
-		print('Error: invalid XML response received...')
-		sys.exit(-1)
+		raise RPCError('Error: invalid XML response received...')
 	if not 'type' in xmlobj.attrib:
-		print('Error: missing response type attribute...')
-		sys.exit(-1)
+		raise RPCError('Error: missing response type attribute...')
 	if not xmlobj.attrib['type'] in ['success', 'error']:
-		print('Error: Unknown response type received: ' + xmlobj.attrib['type'])
-		sys.exit(-1)
+		raise RPCError('Error: Unknown response type received: ' + xmlobj.attrib['type'])
+
+def send_rpcchunk(req, printxmlres=False):
+	ret = {}
+	xmlobj = None
+	depth = 0
+
+	try:
+		xmlreq = get_rawxml(req)
+		response = post_rpcrequest(xmlreq)
+
+		if response.getheader('Content-Encoding', '').lower() == 'gzip':
+			import gzip
+			response = gzip.GzipFile(fileobj=response, mode='rb')
+
+		if printxmlres:
+			import io
+			xmlres = response.read()
+			print(xmlres.decode('utf-8'))
+			response = io.BytesIO(xmlres)
+
+		# Parse the response as it is received, collecting each child of the
+		# response element as soon as it is complete
+		for event, el in et.iterparse(response, events=('start', 'end')):
+			if event == 'start':
+				if xmlobj is None:
+					xmlobj = el
+					check_rpcresponse(xmlobj)
+				depth = depth + 1
+				continue
+
+			depth = depth - 1
+			if depth != 1 or xmlobj.attrib['type'] == 'error':
+				continue
+
+			ret.setdefault(el.tag, []).append(dict(el.attrib))
+			el.clear()
+	except RPCError:
+		raise
+	except Exception as ex:
+		raise RPCError('Error retrieving RPC response: ' + str(ex))
+
 	if xmlobj.attrib['type'] == 'error':
 		code = xmlobj.find('./code').text
 		message = xmlobj.find('./message').text
 		data = xmlobj.find('./data').text
-		print('Error received from RPC server:')
-		print('')
-		print('Code:    ' + code)
-		print('Message: ' + message)
-		print('Data:    ' + data)
-		sys.exit(-1)
+		raise RPCError('Error received from RPC server:\n\nCode:    ' + code + '\nMessage: ' + message + '\nData:    ' + data)
+
+	return ret
+
+def split_rpcrequest(req):
+	methods = list(req)
+	reqs = []
+
+	for i in range(0, len(methods), maxmethods):
+		sub = et.Element(req.tag, dict(req.attrib))
+		for el in methods[i:i+maxmethods]:
+			sub.append(el)
+		reqs.append(sub)
+
+	return reqs
+
+def send_rpcrequest(req, printxmlres=False):
+	global rpcexecutor, rpclocal
+
+	# Set up here in the calling thread, before any worker thread could race to create it
+	if rpclocal is None:
+		import threading
+		rpclocal = threading.local()
+
+	# Lookups change nothing so their parts can be sent in parallel, anything
+	# else must reach the server one part at a time in the order given
+	readonly = all(el.tag == 'lookup' for el in req)
+
+	if len(req) > maxmethods:
+		reqs = split_rpcrequest(req)
+	else:
+		reqs = [req]
 
 	ret = {}
+	sent = 0
 
-	if printxmlres:
-		print(xmlres)
+	try:
+		if readonly and len(reqs) > 1:
+			import concurrent.futures
 
-	for el in xmlobj:
-		if not el.tag in ret:
-			ret[el.tag] = []
-		ret[el.tag].append(el.attrib.copy())
+			if rpcexecutor is None:
+				rpcexecutor = concurrent.futures.ThreadPoolExecutor(max_workers=maxworkers)
+
+			futures = [rpcexecutor.submit(send_rpcchunk, sub, printxmlres) for sub in reqs]
+			parts = (future.result() for future in futures)
+		else:
+			parts = (send_rpcchunk(sub, printxmlres) for sub in reqs)
+
+		for part in parts:
+			for tag, items in part.items():
+				ret.setdefault(tag, []).extend(items)
+			sent = sent + 1
+	except RPCError as ex:
+		# Earlier parts have already been applied, so show what they did
+		if sent > 0:
+			show_results(ret)
+			show_success(ret)
+			show_warnings(ret)
+			show_debuginfo(ret)
+			print('')
+			print('Error: part %d of %d of the request failed, only the results above were completed' % (sent + 1, len(reqs)))
+		print(str(ex))
+		sys.exit(-1)
 
 	return ret
 
@@ -236,62 +472,54 @@ def show_rpcrequest(req):
 	xmlreq = get_rawxml(req).decode('utf-8')
 	print(xmlreq)
 
-def show_success(res):
-	global args, config
-
-	if not 'success' in res:
+def show_messages(res, key, label):
+	if not key in res:
 		return
 
-	for dbg in res['success']:
-		msg = dbg['data']
-		params = []
-		for k in dbg:
-			if k == 'data':
-				continue
-			params.append(k + '=' + str(dbg[k]))
-		info = ', '.join(params)
+	for msg in res[key]:
+		info = ', '.join(k + '=' + v for k, v in msg.items() if k != 'data')
 		if len(info) > 0:
 			info = ' (' + info + ')'
-		print('Success: ' + msg + info)
+		print(label + ': ' + msg['data'] + info)
+
+def show_success(res):
+	show_messages(res, 'success', 'Success')
 
 def show_warnings(res):
-	global args, config
+	show_messages(res, 'warning', 'WARNING')
 
-	if not 'warning' in res:
-		return
+def show_debuginfo(res):
+	global config
 
-	for dbg in res['warning']:
-		msg = dbg['data']
-		params = []
-		for k in dbg:
-			if k == 'data':
-				continue
-			params.append(k + '=' + str(dbg[k]))
-		info = ', '.join(params)
-		if len(info) > 0:
-			info = ' (' + info + ')'
-		print('WARNING: ' + msg + info)
+	if config['debug']:
+		show_messages(res, 'debug', 'Debug')
 
-def show_debuginfo(res):
-	global args, config
+def show_results(res):
+	if not 'result' in res:
+		return 0
 
-	if not config['debug']:
-		return
+	import datetime
 
-	if not 'debug' in res:
-		return
+	cols = {'timestamp': ['Time', 5], 'id': ['ID', 3], 'ip': ['IP', 3], 'type': ['Type', 5], 'listed': ['Listed', 7], 'comment': ['Comment', 8]}
 
-	for dbg in res['debug']:
-		msg = dbg['data']
-		params = []
-		for k in dbg:
-			if k == 'data':
-				continue
-			params.append(k + '=' + str(dbg[k]))
-		info = ', '.join(params)
-		if len(info) > 0:
-			info = ' (' + info + ')'
-		print('Debug: ' + msg + info)
+	results = res['result']
+	for r in results:
+		if 'timestamp' in r:
+			r['timestamp'] = datetime.datetime.fromtimestamp(int(r['timestamp'])).isoformat()
+		for k, v in r.items():
+			col = cols.get(k)
+			if col is not None and len(v) > col[1]:
+				col[1] = len(v) + 1
+
+	widths = [(k, cols[k][1]) for k in cols]
+
+	print(' '.join(name.ljust(width) for name, width in cols.values()))
+	print(' '.join('=' * width for name, width in cols.values()))
+
+	for r in results:
+		print(' '.join(r.get(k, '').ljust(width) for k, width in widths))
+
+	return len(results)
 
 def do_help():
 	parser.print_help()
@@ -329,9 +557,7 @@ def do_config():
 		config['rpckey'] = args.rpckey
 
 	try:
-		fc = open(args.conffile, 'w')
-		newconfig = json.dump(config, fc)
-		fc.close()
+		save_config()
 	except Exception as ex:
 		print('Unable to update configuration: %s' % (str(ex)))
 		sys.exit(1)
@@ -363,92 +589,40 @@ def do_types():
 def do_query():
 	global args, config
 
-	startts = datetime.datetime.now()
+	startts = time.perf_counter()
 
 	req = get_rpcrequest()
 
-	kwargs = {}
-	if args.own:
-		kwargs['own'] = '1'
-	if args.limit is not None:
-		kwargs['limit'] = str(args.limit)
-	if args.listed is not None:
-		kwargs['listed'] = str(args.listed)
-	if args.type is not None:
-		kwargs['type'] = str(args.type)
-	if args.start is not None:
-		kwargs['start'] = str(args.start)
-	if args.stop is not None:
-		kwargs['stop'] = str(args.stop)
+	kwargs = get_methodargs(queryopts)
 
 	for item in args.idorip:
-		if isinstance(item, int):
-			req_addmethod(req, 'lookup', id=str(item), **kwargs)
+		if item.isdigit():
+			req_addmethod(req, 'lookup', id=item, **kwargs)
 		else:
-			req_addmethod(req, 'lookup', ip=str(item), **kwargs)
+			req_addmethod(req, 'lookup', ip=item, **kwargs)
 
 	res = send_rpcrequest(req)
 
-	cols = {'timestamp': ['Time', 5], 'id': ['ID', 3], 'ip': ['IP', 3], 'type': ['Type', 5], 'listed': ['Listed', 7], 'comment': ['Comment', 8]}
+	count = show_results(res)
 
-	results = []
-	if 'result' in res:
-		for r in res['result']:
-			if 'timestamp' in r:
-				dt = datetime.datetime.fromtimestamp(int(r['timestamp']))
-				r['timestamp'] = dt.isoformat()
-			for k in cols:
-				if not k in r:
-					continue
-				if len(r[k]) > cols[k][1]:
-					cols[k][1] = len(r[k]) + 1
-			results.append(r)
-
-		headtext = ''
-		headline = ''
-		for k in cols:
-			if len(headtext) > 0:
-				headtext = headtext + ' '
-				headline = headline + ' '
-			headtext = headtext + cols[k][0].ljust(cols[k][1])
-			headline = headline + ('=' * cols[k][1])
-
-		print(headtext)
-		print(headline)
-
-		for r in results:
-			line = ''
-			for k in cols:
-				if len(line) > 0:
-					line = line + ' '
-				line = line + r[k].ljust(cols[k][1])
-			print(line)
-
-	endts = datetime.datetime.now()
-	delay = endts - startts
+	delay = time.perf_counter() - startts
 
 	show_warnings(res)
 	show_debuginfo(res)
 
-	print(str(len(results)) + ' results found in ' + str(delay))
+	print('%d results found in %.3fs' % (count, delay))
 
 def do_add():
 	global args, config
 
-	startts = datetime.datetime.now()
+	startts = time.perf_counter()
 
 	req = get_rpcrequest()
 
-	kwargs = {}
-	if args.type is not None:
-		kwargs['type'] = str(args.type)
-	if args.port is not None:
-		kwargs['port'] = str(args.port)
-	if args.comment is not None:
-		kwargs['comment'] = args.comment
+	kwargs = get_methodargs(addopts)
 
 	for ip in args.ip:
-		req_addmethod(req, 'add', ip=str(ip), **kwargs)
+		req_addmethod(req, 'add', ip=ip, **kwargs)
 
 	res = send_rpcrequest(req)
 
@@ -457,20 +631,19 @@ def do_add():
 	show_warnings(res)
 	show_debuginfo(res)
 
-	endts = datetime.datetime.now()
-	delay = endts - startts
+	delay = time.perf_counter() - startts
 
-	print('Completed in ' + str(delay))
+	print('Completed in %.3fs' % (delay))
 
 def do_remove():
 	global args, config
 
-	startts = datetime.datetime.now()
+	startts = time.perf_counter()
 
 	req = get_rpcrequest()
 
 	for id in args.id:
-		req_addmethod(req, 'remove', id=str(id))
+		req_addmethod(req, 'remove', id=id)
 
 	res = send_rpcrequest(req)
 
@@ -479,36 +652,94 @@ def do_remove():
 	show_warnings(res)
 	show_debuginfo(res)
 
-	endts = datetime.datetime.now()
-	delay = endts - startts
+	delay = time.perf_counter() - startts
 
-	print('Completed in ' + str(delay))
+	print('Completed in %.3fs' % (delay))
 
 def do_update():
 	global args, config
 
-	startts = datetime.datetime.now()
+	startts = time.perf_counter()
 
 	req = get_rpcrequest()
 
-	kwargs = {}
-	if args.comment is not None:
-		kwargs['comment'] = args.comment
+	kwargs = get_methodargs(updateopts)
 
 	for id in args.id:
-		req_addmethod(req, 'update', id=str(id), **kwargs)
+		req_addmethod(req, 'update', id=id, **kwargs)
+
+	res = send_rpcrequest(req)
+
+	show_success(res)
+
+	show_warnings(res)
+	show_debuginfo(res)
+
+	delay = time.perf_counter() - startts
+
+	print('Completed in %.3fs' % (delay))
+
+def do_batch():
+	global args, config
+
+	import shlex
+
+	startts = time.perf_counter()
+
+	req = get_rpcrequest()
+
+	for lineno, line in enumerate(args.file, 1):
+		try:
+			tokens = shlex.split(line, comments=True)
+		except ValueError as ex:
+			print('Error: line %d: %s' % (lineno, str(ex)))
+			sys.exit(-1)
+
+		if len(tokens) == 0:
+			continue
+
+		method = tokens[0]
+		if not method in batchmethods:
+			print('Error: line %d: unknown method: %s' % (lineno, method))
+			sys.exit(-1)
+
+		kwargs = {}
+		for token in tokens[1:]:
+			name, sep, value = token.partition('=')
+			if len(sep) == 0 or len(name) == 0:
+				print('Error: line %d: invalid parameter: %s' % (lineno, token))
+				sys.exit(-1)
+			if not name in batchmethods[method]:
+				print('Error: line %d: unknown parameter for %s: %s' % (lineno, method, name))
+				sys.exit(-1)
+			if name in batchvalidators:
+				try:
+					value = batchvalidators[name](value)
+				except ValueError as ex:
+					print('Error: line %d: invalid %s value: %s (%s)' % (lineno, name, value, str(ex)))
+					sys.exit(-1)
+			kwargs[name] = value
+
+		req_addmethod(req, method, **kwargs)
+
+	if args.file is not sys.stdin:
+		args.file.close()
+
+	if len(req) == 0:
+		print('Error: no actions to send')
+		sys.exit(-1)
 
 	res = send_rpcrequest(req)
 
+	show_results(res)
 	show_success(res)
 
 	show_warnings(res)
 	show_debuginfo(res)
 
-	endts = datetime.datetime.now()
-	delay = endts - startts
+	delay = time.perf_counter() - startts
 
-	print('Completed in ' + str(delay))
+	print('Completed in %.3fs' % (delay))
 
 cmds = {
 	'help': do_help,
@@ -517,7 +748,8 @@ cmds = {
 	'query': do_query,
 	'add': do_add,
 	'remove': do_remove,
-	'update': do_update
+	'update': do_update,
+	'batch': do_batch
 	}
 
 parse_args()